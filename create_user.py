@@ -1,24 +1,66 @@
-from typing import Dict, Tuple, Optional
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, NamedTuple, Tuple, Optional
 import boto3
+from botocore.config import Config
+from botocore.endpoint import MAX_POOL_CONNECTIONS
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger("bulkcreate")
+
+
+class User(NamedTuple):
+    """A user row from the input CSV, in CSV column order."""
+
+    email: str
+    username: str
+    display_name: str
+    given_name: str
+    family_name: str
+
+
+@lru_cache(maxsize=None)
+def get_identitystore_client(
+    region: Optional[str] = None, *, max_pool_connections: int = MAX_POOL_CONNECTIONS
+) -> boto3.client:
+    """
+    Create the identitystore client and reuse it.
+
+    Clients are cached per (region, max_pool_connections), so callers that want
+    to share one client must pass the same pool size.
+    """
+    return boto3.client(
+        "identitystore",
+        region_name=region,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            tcp_keepalive=True,
+        ),
+    )
+
+
+# Error message formatters keyed by error code, called with (username, identity_store_id, error_message)
+ERROR_FORMATTERS: Dict[str, Callable[[str, str, str], str]] = {
+    "ConflictException": lambda username, _, __: f"❌ User already exists: {username}",
+    "ValidationException": lambda username, _, error_message: f"❌ Validation error for user {username}: {error_message}",
+    "AccessDeniedException": lambda username, _, __: f"❌ Access denied creating user {username}. Check IAM permissions.",
+    "ResourceNotFoundException": lambda _, identity_store_id, __: f"❌ Identity store not found. Check identity_store_id: {identity_store_id}",
+}
+
 
 def create_user(
-    client: boto3.client, user_data: Dict[str, str], identity_store_id: str
-) -> Tuple[bool, str, Optional[str]]:
+    client: boto3.client, user: User, identity_store_id: str
+) -> Tuple[bool, str, Optional[str], bool]:
     """
     Create a single user in IAM Identity Center using boto3.
 
     Returns:
-        Tuple of (success: bool, message: str, user_id: Optional[str])
+        Tuple of (success: bool, message: str, user_id: Optional[str], existed: bool)
     """
-    email = user_data["email"]
-    username = user_data["username"]
-    display_name = user_data["display_name"]
-    given_name = user_data["given_name"]
-    family_name = user_data["family_name"]
+    email, username, display_name, given_name, family_name = user
 
-    print(f"Creating user: {username} ({display_name})")
+    logger.info("Creating user: %s (%s)", username, display_name)
 
     try:
         response = client.create_user(
@@ -31,29 +73,72 @@ def create_user(
 
         user_id = response.get("UserId")
         success_msg = f"✅ Successfully created user: {username} (ID: {user_id})"
-        print(success_msg)
-        return True, success_msg, user_id
+        logger.info(success_msg)
+        return True, success_msg, user_id, False
 
     except ClientError as e:
         error_code = e.response["Error"]["Code"]
         error_message = e.response["Error"]["Message"]
 
-        # Handle specific error cases
+        # A conflict can come from a retried request whose first attempt already
+        # created the user, so resolve the existing ID instead of failing
         if error_code == "ConflictException":
-            error_msg = f"❌ User already exists: {username}"
-        elif error_code == "ValidationException":
-            error_msg = f"❌ Validation error for user {username}: {error_message}"
-        elif error_code == "AccessDeniedException":
-            error_msg = f"❌ Access denied creating user {username}. Check IAM permissions."
-        elif error_code == "ResourceNotFoundException":
-            error_msg = f"❌ Identity store not found. Check identity_store_id: {identity_store_id}"
+            user_id = find_user_id(client, identity_store_id, username)
+            if user_id:
+                success_msg = f"✅ User already exists: {username} (ID: {user_id})"
+                logger.info(success_msg)
+                return True, success_msg, user_id, True
+
+        # Handle specific error cases
+        formatter = ERROR_FORMATTERS.get(error_code)
+        if formatter:
+            error_msg = formatter(username, identity_store_id, error_message)
         else:
             error_msg = f"❌ Failed to create user {username}: {error_code} - {error_message}"
 
-        print(error_msg)
-        return False, error_msg, None
+        logger.error(error_msg)
+        return False, error_msg, None, False
 
     except Exception as e:
         error_msg = f"❌ Unexpected error creating user {username}: {e}"
-        print(error_msg)
-        return False, error_msg, None
+        logger.error(error_msg)
+        return False, error_msg, None, False
+
+
+def find_user_id(
+    client: boto3.client, identity_store_id: str, username: str
+) -> Optional[str]:
+    """
+    Look up the ID of an existing user by username.
+
+    Returns:
+        The user ID, or None if it could not be resolved
+    """
+    try:
+        response = client.get_user_id(
+            IdentityStoreId=identity_store_id,
+            AlternateIdentifier={
+                "UniqueAttribute": {
+                    "AttributePath": "userName",
+                    "AttributeValue": username,
+                }
+            },
+        )
+    except ClientError:
+        return None
+    return response.get("UserId")
+
+
+def list_existing_users(client: boto3.client, identity_store_id: str) -> Dict[str, str]:
+    """
+    Fetch all users already in the identity store with a single paginated sweep.
+
+    Returns:
+        Dict mapping username to user ID
+    """
+    existing_users = {}
+    paginator = client.get_paginator("list_users")
+    for page in paginator.paginate(IdentityStoreId=identity_store_id):
+        for user in page["Users"]:
+            existing_users[user["UserName"]] = user["UserId"]
+    return existing_users
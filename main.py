@@ -9,56 +9,240 @@ Example: john.doe@example.com,johndoe,John Doe,John,Doe
 """
 
 import argparse
+import atexit
 import csv
+import logging
+import logging.handlers
+import queue
 import sys
-from typing import Dict, List
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set
 import boto3
-from create_user import create_user
-from subscribe import subscribe
-
-
-def read_users_from_csv(csv_file: str) -> List[Dict[str, str]]:
-    """Read user data from CSV file."""
-    users = []
-
-    with open(csv_file, "r", newline="", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-
-        for row_num, row in enumerate(
-            reader, start=2
-        ):  # Start at 2 because header is row 1
-            # Strip whitespace from all fields
-            user_data = {key: value.strip() for key, value in row.items()}
-
-            # Skip empty rows
-            if not any(user_data.values()):
-                continue
-
-            # Validate required fields
-            missing_fields = [key for key, value in user_data.items() if not value]
-            if missing_fields:
-                print(
-                    f"❌ Skipping row {row_num} with missing fields: {missing_fields}"
-                )
-                print(f"   Row data: {dict(user_data)}")
-                continue
-
-            # Basic validation for username (IAM Identity Center restrictions)
-            if user_data["username"].lower() in ["administrator", "awsadministrators"]:
-                print(
-                    f"❌ Skipping row {row_num}: Username '{user_data['username']}' is reserved"
-                )
-                continue
-
-            if len(user_data["username"]) > 128:
-                print(
-                    f"❌ Skipping row {row_num}: Username '{user_data['username']}' exceeds 128 characters"
-                )
-                continue
-
-            users.append(user_data)
-
-    return users
+from create_user import (
+    User,
+    create_user,
+    get_identitystore_client,
+    list_existing_users,
+)
+from subscribe import (
+    configure_pool,
+    list_subscribed_principals,
+    subscribe,
+    warm_up,
+)
+
+logger = logging.getLogger("bulkcreate")
+
+# Read the CSV in 1 MiB chunks to keep read() syscalls low on large files
+CSV_BUFFER_SIZE = 1 << 20
+
+# IAM Identity Center username restrictions
+RESERVED_USERNAMES = frozenset({"administrator", "awsadministrators"})
+MAX_USERNAME_LENGTH = 128
+
+# Minimum size of the HTTP connection pools; pools grow to one connection per worker thread
+MIN_POOL_SIZE = 32
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Route log records through a queue so worker threads never block on stdout.
+
+    Returns:
+        The started QueueListener that writes records to stdout
+    """
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    return listener
+
+
+class CSVReadError(Exception):
+    """Raised when the CSV file cannot be read past a given row."""
+
+    def __init__(self, last_row: int, error: Exception):
+        super().__init__(str(error))
+        self.last_row = last_row
+
+
+def iter_users_from_csv(csv_file: str) -> Iterator[User]:
+    """Stream valid users from CSV file, one row at a time."""
+    with open(
+        csv_file, "r", newline="", encoding="utf-8", buffering=CSV_BUFFER_SIZE
+    ) as file:
+        reader = csv.reader(file)
+
+        header = tuple(map(str.strip, next(reader, [])))
+        if header != User._fields:
+            raise ValueError(
+                f"Invalid CSV header {header}, expected: {','.join(User._fields)}"
+            )
+
+        # Decoding happens in chunks, so a bad byte also loses the rows just before it
+        last_row = 1
+        try:
+            for row_num, row in enumerate(
+                reader, start=2
+            ):  # Start at 2 because header is row 1
+                last_row = row_num
+
+                # Strip whitespace from all fields
+                fields = tuple(map(str.strip, row))
+
+                # Skip empty rows
+                if not any(fields):
+                    continue
+
+                if len(fields) != len(User._fields):
+                    logger.error(
+                        "❌ Skipping row %s: expected %s fields, got %s",
+                        row_num,
+                        len(User._fields),
+                        len(fields),
+                    )
+                    continue
+
+                user = User(*fields)
+
+                # Validate required fields
+                if not all(user):
+                    missing_fields = [
+                        key for key, value in zip(User._fields, user) if not value
+                    ]
+                    logger.error(
+                        "❌ Skipping row %s with missing fields: %s", row_num, missing_fields
+                    )
+                    logger.error("   Row data: %s", user._asdict())
+                    continue
+
+                # Basic validation for username (IAM Identity Center restrictions)
+                if user.username.lower() in RESERVED_USERNAMES:
+                    logger.error(
+                        "❌ Skipping row %s: Username '%s' is reserved",
+                        row_num,
+                        user.username,
+                    )
+                    continue
+
+                if len(user.username) > MAX_USERNAME_LENGTH:
+                    logger.error(
+                        "❌ Skipping row %s: Username '%s' exceeds %s characters",
+                        row_num,
+                        user.username,
+                        MAX_USERNAME_LENGTH,
+                    )
+                    continue
+
+                yield user
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise CSVReadError(last_row, e) from e
+
+
+def cancel_pending(futures: Iterable[Future]) -> None:
+    """Cancel every future that has not started running yet."""
+    for future in futures:
+        future.cancel()
+
+
+class Result(NamedTuple):
+    """
+    Outcome of creating and subscribing a single user.
+
+    created is True when the user is in the identity store after this run,
+    existed is True when it was already there and no user was created.
+    subscribed and already_subscribed follow the same pattern for the
+    Amazon Q Developer subscription.
+    """
+
+    username: str
+    created: bool
+    existed: bool
+    message: str
+    subscribed: bool
+    already_subscribed: bool
+    subscription_message: str
+
+
+def process_one(
+    client: boto3.client,
+    user: User,
+    identity_store_id: str,
+    existing_users: Dict[str, str],
+    subscribed_principals: Set[str],
+) -> Result:
+    """
+    Create a single user and subscribe them to Amazon Q Developer.
+
+    Users that already exist in the identity store are not created again,
+    but are still subscribed using their existing user ID. Users that are
+    already subscribed are not subscribed again.
+
+    Returns:
+        Result of the create and subscribe steps
+    """
+    existed = user.username in existing_users
+    if existed:
+        user_id = existing_users[user.username]
+        success = True
+        message = f"✅ User already exists: {user.username} (ID: {user_id})"
+        logger.info(message)
+    else:
+        success, message, user_id, existed = create_user(
+            client, user, identity_store_id
+        )
+
+    subscription_success = False
+    already_subscribed = False
+    subscription_message = ""
+
+    if success and user_id in subscribed_principals:
+        subscription_success = True
+        already_subscribed = True
+        subscription_message = f"✅ User already subscribed: {user.username}"
+        logger.info("  %s", subscription_message)
+    elif success and user_id:
+        # User created successfully, now subscribe them
+        logger.info(
+            "  Subscribing user %s to Amazon Q Developer...", user.username
+        )
+        try:
+            response = subscribe(user_id, "USER")
+            if response.status_code == 200:
+                subscription_success = True
+                subscription_message = f"✅ Successfully subscribed user: {user.username}"
+            else:
+                subscription_message = f"❌ Failed to subscribe user {user.username}: HTTP {response.status_code} - {response.text}"
+        except Exception as e:
+            subscription_message = f"❌ Error subscribing user {user.username}: {e}"
+        logger.info("  %s", subscription_message)
+    else:
+        # User creation failed, skip subscription
+        subscription_message = "❌ Skipped subscription due to user creation failure"
+
+    return Result(
+        username=user.username,
+        created=success,
+        existed=existed,
+        message=message,
+        subscribed=subscription_success,
+        already_subscribed=already_subscribed,
+        subscription_message=subscription_message,
+    )
 
 
 def main():
@@ -77,7 +261,7 @@ jane.smith@example.com,janesmith,Jane Smith,Jane,Smith
 Requirements:
 - boto3 library (pip install boto3)
 - AWS credentials configured
-- identitystore:CreateUser permission
+- identitystore:CreateUser, identitystore:ListUsers and identitystore:GetUserId permissions
         """,
     )
 
@@ -88,114 +272,199 @@ Requirements:
         "identity_store_id", help="IAM Identity Center Identity Store ID"
     )
 
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of users to process concurrently (default: 8)",
+    )
+
     args = parser.parse_args()
 
-    print("IAM Identity Center Bulk User Creation Script (boto3)")
-    print("===================================================")
-    print(f"CSV File: {args.csv_file}")
-    print(f"Identity Store ID: {args.identity_store_id}")
-    print()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    # Emit UTF-8 regardless of the console code page so emoji never raise UnicodeEncodeError
+    for stream in (sys.stdout, sys.stderr):
+        if hasattr(stream, "reconfigure"):
+            stream.reconfigure(encoding="utf-8", line_buffering=True)
+
+    listener = setup_logging()
+    atexit.register(listener.stop)
+
+    logger.info("IAM Identity Center Bulk User Creation Script (boto3)")
+    logger.info("===================================================")
+    logger.info("CSV File: %s", args.csv_file)
+    logger.info("Identity Store ID: %s", args.identity_store_id)
+    logger.info("Concurrency: %s", args.concurrency)
+    logger.info("")
+
+    pool_size = max(args.concurrency, MIN_POOL_SIZE)
+    configure_pool(pool_size)
 
     # Initialize AWS client
-    client = boto3.client("identitystore")
+    client = get_identitystore_client(max_pool_connections=pool_size)
 
-    # Read users from CSV
+    # Look up existing users once so re-runs skip already-created users
     try:
-        users = read_users_from_csv(args.csv_file)
+        existing_users = list_existing_users(client, args.identity_store_id)
     except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        sys.exit(1)
+        logger.warning("⚠️  Could not list existing users, creating all users: %s", e)
+        existing_users = {}
+    else:
+        logger.info("Found %s existing users in identity store", len(existing_users))
 
-    if not users:
-        print("No valid users found in CSV file")
-        sys.exit(1)
+    # Resolve credentials and connect to the subscription endpoint up front
+    warm_up()
 
-    print(f"Found {len(users)} valid users to create")
-    print()
+    # Look up existing subscriptions once so re-runs skip already-subscribed users
+    try:
+        subscribed_principals = list_subscribed_principals()
+    except Exception as e:
+        logger.warning(
+            "⚠️  Could not list existing subscriptions, subscribing all users: %s", e
+        )
+        subscribed_principals = set()
+    else:
+        logger.info("Found %s existing subscriptions", len(subscribed_principals))
 
     # Initialize counters
-    total_users = len(users)
-    successful_users = 0
-    failed_users = 0
-    successful_subscriptions = 0
-    failed_subscriptions = 0
-    results = []
-
-    # Process each user
-    for i, user_data in enumerate(users, 1):
-        print(f"[{i}/{total_users}] ", end="")
-        success, message, user_id = create_user(client, user_data, args.identity_store_id)
-        
-        subscription_success = False
-        subscription_message = ""
-        
-        if success and user_id:
-            # User created successfully, now subscribe them
-            print(f"  Subscribing user {user_data['username']} to Amazon Q Developer...")
-            try:
-                response = subscribe(user_id, "USER")
-                if response.status_code == 200:
-                    subscription_success = True
-                    subscription_message = f"✅ Successfully subscribed user: {user_data['username']}"
-                    print(f"  {subscription_message}")
-                    successful_subscriptions += 1
-                else:
-                    subscription_message = f"❌ Failed to subscribe user {user_data['username']}: HTTP {response.status_code} - {response.text}"
-                    print(f"  {subscription_message}")
-                    failed_subscriptions += 1
-            except Exception as e:
-                subscription_message = f"❌ Error subscribing user {user_data['username']}: {e}"
-                print(f"  {subscription_message}")
-                failed_subscriptions += 1
+    counts = Counter()
+    failed_creates: List[Result] = []
+    failed_subscribes: List[Result] = []
+
+    def record(future: Future) -> None:
+        """Tally the result of a finished user."""
+        result = future.result()
+        counts["processed"] += 1
+
+        if result.existed:
+            counts["existed"] += 1
+        elif result.created:
+            counts["created"] += 1
         else:
-            # User creation failed, skip subscription
-            failed_subscriptions += 1
-            subscription_message = "❌ Skipped subscription due to user creation failure"
-        
-        results.append((
-            user_data["username"], 
-            success, 
-            message, 
-            subscription_success, 
-            subscription_message
-        ))
-
-        if success:
-            successful_users += 1
+            counts["create_failed"] += 1
+            failed_creates.append(result)
+
+        if result.already_subscribed:
+            counts["already_subscribed"] += 1
+        elif result.subscribed:
+            counts["subscribed"] += 1
         else:
-            failed_users += 1
+            counts["subscribe_failed"] += 1
+            if result.created:
+                failed_subscribes.append(result)
+
+        logger.info(
+            "[%s] Finished processing user: %s", counts["processed"], result.username
+        )
+        logger.info("")  # Add blank line between users
+
+    # Stream users from CSV and process them concurrently as rows arrive, keeping
+    # only a bounded number of users in flight so memory does not grow with the file
+    max_pending = 2 * args.concurrency
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        pending = set()
+        seen_usernames = set()
+        csv_error = None
+        try:
+            try:
+                for user in iter_users_from_csv(args.csv_file):
+                    if user.username in seen_usernames:
+                        logger.warning(
+                            "⚠️  Skipping duplicate username in CSV: %s", user.username
+                        )
+                        continue
+                    seen_usernames.add(user.username)
+
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(future)
+
+                    pending.add(
+                        executor.submit(
+                            process_one,
+                            client,
+                            user,
+                            args.identity_store_id,
+                            existing_users,
+                            subscribed_principals,
+                        )
+                    )
+            except Exception as e:
+                # Users already submitted may have been created, so let them finish
+                # and report them in the summary instead of exiting straight away
+                csv_error = e
+                logger.error("Error reading CSV file: %s", e)
+
+            for future in as_completed(pending):
+                record(future)
+        except BaseException:
+            # Stop queued users from being created when the run is aborted (e.g. Ctrl-C),
+            # otherwise the executor would wait for every queued user on exit
+            cancel_pending(pending)
+            raise
+
+    if counts["processed"] == 0:
+        if csv_error is None:
+            logger.error("No valid users found in CSV file")
+        sys.exit(1)
 
-        print()  # Add blank line between users
+    failed_users = counts["create_failed"]
+    failed_subscriptions = counts["subscribe_failed"]
 
     # Summary
-    print("===================================================")
-    print("Bulk User Creation and Subscription Summary")
-    print("===================================================")
-    print(f"Total users processed: {total_users}")
-    print(f"Successfully created: {successful_users}")
-    print(f"Failed to create: {failed_users}")
-    print(f"Successfully subscribed: {successful_subscriptions}")
-    print(f"Failed to subscribe: {failed_subscriptions}")
-    print()
+    logger.info("===================================================")
+    logger.info("Bulk User Creation and Subscription Summary")
+    logger.info("===================================================")
+    logger.info("Total users processed: %s", counts["processed"])
+    logger.info("Successfully created: %s", counts["created"])
+    logger.info("Already existed: %s", counts["existed"])
+    logger.info("Failed to create: %s", failed_users)
+    logger.info("Successfully subscribed: %s", counts["subscribed"])
+    logger.info("Already subscribed: %s", counts["already_subscribed"])
+    logger.info("Failed to subscribe: %s", failed_subscriptions)
+    logger.info("")
 
     if failed_users > 0 or failed_subscriptions > 0:
-        print("⚠️  Some operations failed. Please check the errors above.")
+        logger.warning("⚠️  Some operations failed. Please check the errors above.")
         
-        if failed_users > 0:
-            print("\nFailed user creations:")
-            for username, success, message, _, _ in results:
-                if not success:
-                    print(f"  - {username}: {message}")
-        
-        if failed_subscriptions > 0:
-            print("\nFailed subscriptions:")
-            for username, user_success, _, sub_success, sub_message in results:
-                if user_success and not sub_success:
-                    print(f"  - {username}: {sub_message}")
+        if failed_creates:
+            logger.info("\nFailed user creations:")
+            for result in failed_creates:
+                logger.info("  - %s: %s", result.username, result.message)
         
+        if failed_subscribes:
+            logger.info("\nFailed subscriptions:")
+            for result in failed_subscribes:
+                logger.info("  - %s: %s", result.username, result.subscription_message)
+
+    if isinstance(csv_error, CSVReadError):
+        logger.error(
+            "\n❌ Stopped reading CSV file early: %s. Row %s was the last row read, "
+            "rows after it were not processed.",
+            csv_error,
+            csv_error.last_row,
+        )
+    elif csv_error is not None:
+        logger.error(
+            "\n❌ Stopped reading CSV file early: %s. Rows at or after the error were not processed.",
+            csv_error,
+        )
+
+    if failed_users > 0 or failed_subscriptions > 0 or csv_error is not None:
         sys.exit(1)
+
+    if counts["existed"] > 0 or counts["already_subscribed"] > 0:
+        logger.info(
+            "🎉 All users are in place and subscribed "
+            "(%s already existed, %s already subscribed)!",
+            counts["existed"],
+            counts["already_subscribed"],
+        )
     else:
-        print("🎉 All users created and subscribed successfully!")
+        logger.info("🎉 All users created and subscribed successfully!")
 
 
 if __name__ == "__main__":
@@ -1,38 +1,151 @@
 import boto3
 import json
+from functools import lru_cache
 from botocore.awsrequest import AWSRequest
 from botocore.auth import SigV4Auth
+from botocore.exceptions import NoCredentialsError
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from urllib3.exceptions import HTTPError
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
 
+_ENDPOINT = "https://codewhisperer.us-east-1.amazonaws.com/"
+
+_BASE_HEADERS = {
+    "Content-Type": "application/x-amz-json-1.0",
+    "X-Amz-User-Agent": "aws-sdk-js/2.1594.0 promise",
+}
+
+# Shared HTTP session so connections are kept alive and reused across users
+_http = requests.Session()
+
+
+def configure_pool(pool_size):
+    """
+    Mount a pooled adapter holding up to pool_size connections, retrying throttled
+    requests with exponential backoff. Call this before sending any requests.
+    """
+    previous_adapter = _http.adapters.get("https://")
+    _http.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            # CreateAssignment is not idempotent: only retry when the request was
+            # never sent (connect errors) or was rejected before processing (429/503)
+            max_retries=Retry(
+                total=5,
+                read=0,
+                backoff_factor=0.5,
+                status_forcelist=[429, 503],
+                allowed_methods=frozenset(["POST"]),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        ),
+    )
+    if previous_adapter is not None:
+        previous_adapter.close()
 
-def subscribe(principal_id, principal_type="USER"):
-    """Make a request to AmazonQDeveloperService.CreateAssignment"""
 
-    # Get AWS credentials
+configure_pool(DEFAULT_POOLSIZE)
+
+
+@lru_cache(maxsize=1)
+def _get_credentials():
+    """Resolve AWS credentials once and reuse them (refreshable credentials stay refreshable)"""
     session = boto3.Session()
-    credentials = session.get_credentials()
+    return session.get_credentials()
+
+
+def _get_signer():
+    """
+    Build a SigV4 signer from a frozen snapshot of the cached credentials.
+
+    Freezing per request keeps the access key, secret key and token consistent
+    even if refreshable credentials rotate while other threads are signing.
+    """
+    credentials = _get_credentials()
+    if credentials is None:
+        raise NoCredentialsError()
+    return SigV4Auth(credentials.get_frozen_credentials(), "q", "us-east-1")
+
+
+def warm_up():
+    """Resolve credentials and open a pooled connection before the first subscribe call"""
+    _get_credentials()
+    try:
+        # Go straight to the pool requests will use, so the HEAD is never retried
+        adapter = _http.get_adapter(_ENDPOINT)
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            request = requests.Request("HEAD", _ENDPOINT).prepare()
+            pool = adapter.get_connection_with_tls_context(request, verify=True)
+        else:
+            pool = adapter.get_connection(_ENDPOINT)
+        pool.urlopen("HEAD", "/", retries=False, timeout=Timeout(connect=3.05, read=5))
+    except HTTPError:
+        # Warm-up is best effort, the real request will surface any errors
+        pass
 
-    # Prepare payload
-    payload = {"principalId": principal_id, "principalType": principal_type}
+
+def _send(operation, payload):
+    """Sign and send a request to the given AmazonQDeveloperService operation"""
 
     # Create request
+    headers = dict(_BASE_HEADERS)
+    headers["X-Amz-Target"] = f"AmazonQDeveloperService.{operation}"
     request = AWSRequest(
         method="POST",
-        url="https://codewhisperer.us-east-1.amazonaws.com/",
-        data=json.dumps(payload),
-        headers={
-            "Content-Type": "application/x-amz-json-1.0",
-            "X-Amz-Target": "AmazonQDeveloperService.CreateAssignment",
-            "X-Amz-User-Agent": "aws-sdk-js/2.1594.0 promise",
-        },
+        url=_ENDPOINT,
+        data=payload,
+        headers=headers,
     )
 
     # Sign with service name 'q'
-    SigV4Auth(credentials, "q", "us-east-1").add_auth(request)
+    _get_signer().add_auth(request)
 
     # Send request
-    response = requests.post(
-        request.url, headers=dict(request.headers), data=request.body
+    response = _http.post(
+        request.url,
+        headers=dict(request.headers),
+        data=request.body,
+        timeout=(3.05, 30),
     )
 
     return response
+
+
+def subscribe(principal_id, principal_type="USER"):
+    """Make a request to AmazonQDeveloperService.CreateAssignment"""
+
+    # Prepare payload (principal IDs and types are plain ASCII identifiers, no escaping needed)
+    payload = f'{{"principalId":"{principal_id}","principalType":"{principal_type}"}}'
+
+    return _send("CreateAssignment", payload)
+
+
+def list_subscribed_principals():
+    """Page through AmazonQDeveloperService.ListAssignments and return the assigned principal IDs"""
+    principal_ids = set()
+    body = {}
+
+    while True:
+        response = _send("ListAssignments", json.dumps(body))
+        response.raise_for_status()
+        page = response.json()
+
+        # Fail loudly on an unexpected response shape rather than reporting zero assignments
+        if "assignments" not in page:
+            raise ValueError(
+                f"Unexpected ListAssignments response, missing 'assignments': {page}"
+            )
+
+        principal_ids.update(
+            assignment["principalId"] for assignment in page["assignments"]
+        )
+
+        next_token = page.get("nextToken")
+        if not next_token:
+            return principal_ids
+        body = {"nextToken": next_token}